@@ -25,6 +25,8 @@ N8N_WEBHOOK_URL = os.getenv('N8N_WEBHOOK_URL', 'http://localhost:5678/webhook/ne
 N8N_SECRET_KEY = os.getenv('N8N_SECRET_KEY', 'default-secret-key-change-in-production')
 N8N_WEBHOOK_TIMEOUT = int(os.getenv('N8N_WEBHOOK_TIMEOUT', '5'))
 N8N_ENABLED = os.getenv('N8N_ENABLED', 'True').lower() == 'true'
+N8N_WORKERS = int(os.getenv('N8N_WORKERS', '4'))
+N8N_MAX_PENDING = int(os.getenv('N8N_MAX_PENDING', '100'))
 
 
 # APPLICATIONS
@@ -88,6 +90,22 @@ DATABASES = {
 }
 
 
+# CACHE — set REDIS_URL to share cached values between worker processes
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {
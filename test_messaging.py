@@ -1,210 +1,331 @@
 #!/usr/bin/env python3
 """
 Comprehensive test suite for LocalFarmConnect Messaging System
+
+Run with: python manage.py test test_messaging
 """
 
-import os
-import django
-from django.test import TestCase, Client
+from importlib import import_module
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.core.exceptions import PermissionDenied
-from users.models import Product, Conversation, Message, FarmerProfile, Category
-
-# Setup Django
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-django.setup()
+from users.caching import conversation_count_key
+from users.models import Product, Conversation, Message, MessageQuerySet, FarmerProfile, Category
 
 User = get_user_model()
 
-def test_messaging_system():
-    print("🧪 Comprehensive Messaging System Test")
-    print("=" * 60)
-    
-    # Create test data
-    print("\n1️⃣ Setting up test data...")
-    
-    # Get or create users
-    buyer, _ = User.objects.get_or_create(
-        username='testbuyer',
-        defaults={
-            'email': 'buyer@test.com',
-            'user_type': 'buyer'
-        }
-    )
-    
-    farmer_user, _ = User.objects.get_or_create(
-        username='testfarmer',
-        defaults={
-            'email': 'farmer@test.com',
-            'user_type': 'farmer'
-        }
-    )
-    
-    # Get or create farmer profile
-    farmer_profile, _ = FarmerProfile.objects.get_or_create(
-        user=farmer_user,
-        defaults={
-            'farm_name': 'Test Farm',
-            'location': 'Test Location'
-        }
-    )
-    
-    # Get or create category
-    category, _ = Category.objects.get_or_create(name='vegetables')
-    
-    # Get or create product
-    product, _ = Product.objects.get_or_create(
-        farmer=farmer_profile,
-        category=category,
-        defaults={
-            'name': 'Test Product',
-            'description': 'Test description',
-            'price': 10.00,
-            'quantity_available': 100
-        }
-    )
-    
-    print(f"   ✓ Buyer: {buyer.username}")
-    print(f"   ✓ Farmer: {farmer_user.username}")
-    print(f"   ✓ Product: {product.name}")
-    
-    # Test 2: Conversation Creation
-    print("\n2️⃣ Testing Conversation Creation...")
-    
-    conversation, created = Conversation.objects.get_or_create(
-        buyer=buyer,
-        farmer=farmer_user,
-        product=product
-    )
-    
-    if created:
-        print("   ✓ New conversation created")
-    else:
-        print("   ✓ Existing conversation found")
-    
-    # Test 3: Message Creation
-    print("\n3️⃣ Testing Message Creation...")
-    
-    message = Message.objects.create(
-        conversation=conversation,
-        sender=buyer,
-        content="Hello! Is this product available?"
-    )
-    
-    print(f"   ✓ Message created: {message.content}")
-    print(f"   ✓ Message timestamp: {message.timestamp}")
-    print(f"   ✓ Message is from buyer: {message.is_from_buyer}")
-    
-    # Test 4: Conversation Properties
-    print("\n4️⃣ Testing Conversation Properties...")
-    
-    other_participant = conversation.other_participant(buyer)
-    print(f"   ✓ Other participant for buyer: {other_participant.username}")
-    
-    other_participant_farmer = conversation.other_participant(farmer_user)
-    print(f"   ✓ Other participant for farmer: {other_participant_farmer.username}")
-    
-    unread_count = conversation.unread_count(farmer_user)
-    print(f"   ✓ Unread count for farmer: {unread_count}")
-    
-    last_message = conversation.last_message
-    print(f"   ✓ Last message: {last_message.content[:30]}...")
-    
-    # Test 5: Message Read Status
-    print("\n5️⃣ Testing Message Read Status...")
-    
-    print(f"   ✓ Initial read status: {message.is_read}")
-    
-    message.mark_as_read()
-    print(f"   ✓ After marking as read: {message.is_read}")
-    
-    # Test 6: Security Validation
-    print("\n6️⃣ Testing Security Validation...")
-    
-    # Test conversation validation
-    try:
+
+@override_settings(N8N_ENABLED=False)
+class MessagingSystemTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Runs once per class inside the test transaction
+        cls.buyer = User.objects.create(
+            username='testbuyer',
+            email='buyer@test.com',
+            user_type='buyer'
+        )
+        cls.farmer_user = User.objects.create(
+            username='testfarmer',
+            email='farmer@test.com',
+            user_type='farmer'
+        )
+        cls.farmer_profile = FarmerProfile.objects.create(
+            user=cls.farmer_user,
+            farm_name='Test Farm',
+            location='Test Location'
+        )
+        cls.category = Category.objects.create(name='vegetables')
+        cls.product = Product.objects.create(
+            farmer=cls.farmer_profile,
+            category=cls.category,
+            name='Test Product',
+            description='Test description',
+            price=10.00,
+            quantity_available=100
+        )
+        cls.conversation = Conversation.objects.create(
+            buyer=cls.buyer,
+            farmer=cls.farmer_user,
+            product=cls.product
+        )
+        cls.message = Message.objects.create(
+            conversation=cls.conversation,
+            sender=cls.buyer,
+            content="Hello! Is this product available?"
+        )
+
+    def test_message_creation(self):
+        self.assertEqual(self.message.content, "Hello! Is this product available?")
+        self.assertIsNotNone(self.message.timestamp)
+        self.assertTrue(self.message.is_from_buyer)
+
+    def test_conversation_properties(self):
+        self.assertEqual(self.conversation.other_participant(self.buyer), self.farmer_user)
+        self.assertEqual(self.conversation.other_participant(self.farmer_user), self.buyer)
+        self.assertEqual(self.conversation.unread_count(self.farmer_user), 1)
+        self.assertEqual(self.conversation.last_message, self.message)
+
+    def test_message_read_status(self):
+        self.assertFalse(self.message.is_read)
+        self.message.mark_as_read()
+        self.assertTrue(self.message.is_read)
+        self.assertEqual(self.conversation.unread_count(self.farmer_user), 0)
+
+    def test_security_validation(self):
         invalid_conversation = Conversation(
+            buyer=self.farmer_user,
+            farmer=self.farmer_user,  # Same user - should fail
+            product=self.product
+        )
+        # Enforced by the conv_buyer_ne_farmer check constraint, not clean()
+        with self.assertRaises(ValidationError):
+            invalid_conversation.validate_constraints()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            invalid_conversation.save()
+
+    def test_url_routing(self):
+        self.assertEqual(reverse('conversation-list'), '/messages/')
+        self.assertEqual(
+            reverse('conversation-detail', kwargs={'pk': self.conversation.pk}),
+            f'/messages/{self.conversation.pk}/'
+        )
+        self.assertEqual(
+            reverse('start-conversation', kwargs={'product_id': self.product.pk}),
+            f'/messages/start/{self.product.pk}/'
+        )
+
+    def test_unique_constraint(self):
+        with transaction.atomic():
+            duplicate_conversation, duplicate_created = Conversation.objects.get_or_create(
+                buyer=self.buyer,
+                farmer=self.farmer_user,
+                product=self.product
+            )
+        self.assertFalse(duplicate_created)
+        self.assertEqual(duplicate_conversation, self.conversation)
+
+    def test_upsert(self):
+        conversation, created = Conversation.objects.upsert(
+            buyer=self.buyer,
+            farmer=self.farmer_user,
+            product=self.product
+        )
+        self.assertFalse(created)
+        self.assertEqual(conversation, self.conversation)
+
+    @skipUnless(connection.vendor == 'postgresql', "INSERT ... ON CONFLICT path is PostgreSQL-only")
+    def test_upsert_on_conflict(self):
+        buyer = User.objects.create(username='upsertbuyer', user_type='buyer')
+        conversation, created = Conversation.objects.upsert(
             buyer=buyer,
-            farmer=buyer,  # Same user - should fail
-            product=product
-        )
-        invalid_conversation.clean()
-        print("   ⚠️  Security validation failed - should have raised error")
-    except Exception as e:
-        print(f"   ✓ Security validation works: {type(e).__name__}")
-    
-    # Test 7: URL Routing
-    print("\n7️⃣ Testing URL Routing...")
-    
-    try:
-        conversation_list_url = reverse('conversation-list')
-        print(f"   ✓ Conversation list URL: {conversation_list_url}")
-        
-        conversation_detail_url = reverse('conversation-detail', kwargs={'pk': conversation.pk})
-        print(f"   ✓ Conversation detail URL: {conversation_detail_url}")
-        
-        start_conversation_url = reverse('start-conversation', kwargs={'product_id': product.pk})
-        print(f"   ✓ Start conversation URL: {start_conversation_url}")
-        
-    except Exception as e:
-        print(f"   ⚠️  URL routing error: {e}")
-    
-    # Test 8: Database Constraints
-    print("\n8️⃣ Testing Database Constraints...")
-    
-    # Test unique constraint
-    duplicate_conversation, duplicate_created = Conversation.objects.get_or_create(
-        buyer=buyer,
-        farmer=farmer_user,
-        product=product
-    )
-    
-    if not duplicate_created:
-        print("   ✓ Unique constraint works - no duplicate conversation created")
-    else:
-        print("   ⚠️  Unique constraint failed")
-    
-    # Test 9: Message Ordering
-    print("\n9️⃣ Testing Message Ordering...")
-    
-    # Add more messages
-    Message.objects.create(
-        conversation=conversation,
-        sender=farmer_user,
-        content="Yes, it's available!"
-    )
-    
-    Message.objects.create(
-        conversation=conversation,
-        sender=buyer,
-        content="Great! How can I order?"
-    )
-    
-    messages = conversation.messages.all()
-    print(f"   ✓ Total messages: {messages.count()}")
-    
-    for i, msg in enumerate(messages):
-        print(f"   ✓ Message {i+1}: {msg.sender.username} - {msg.content[:20]}...")
-    
-    # Test 10: Cleanup
-    print("\n🔧 Cleaning up test data...")
-    
-    Message.objects.filter(conversation=conversation).delete()
-    Conversation.objects.filter(pk=conversation.pk).delete()
-    
-    print("   ✓ Test data cleaned up")
-    
-    print("\n✅ All tests completed successfully!")
-    print("\n🎯 Messaging System Features Verified:")
-    print("   ✓ Conversation creation and management")
-    print("   ✓ Message creation and ordering")
-    print("   ✓ Read/unread status tracking")
-    print("   ✓ Security validation")
-    print("   ✓ Database constraints")
-    print("   ✓ URL routing")
-    print("   ✓ User role restrictions")
-    print("   ✓ Product-linked conversations")
-
-if __name__ == '__main__':
-    test_messaging_system()
+            farmer=self.farmer_user,
+            product=self.product
+        )
+        self.assertTrue(created)
+        self.assertTrue(Conversation.objects.filter(
+            pk=conversation.pk, buyer=buyer, farmer=self.farmer_user, product=self.product
+        ).exists())
+        self.assertFalse(conversation._state.adding)
+
+        again, created = Conversation.objects.upsert(
+            buyer=buyer,
+            farmer=self.farmer_user,
+            product=self.product
+        )
+        self.assertFalse(created)
+        self.assertEqual(again.pk, conversation.pk)
+
+        # An existing row comes back with its stored counters
+        existing, created = Conversation.objects.upsert(
+            buyer=self.buyer,
+            farmer=self.farmer_user,
+            product=self.product
+        )
+        self.assertFalse(created)
+        self.assertEqual(existing.pk, self.conversation.pk)
+        self.assertEqual(existing.unread_for_farmer, 1)
+        self.assertEqual(existing.created_at, self.conversation.created_at)
+
+    def test_message_ordering(self):
+        # Add more messages in a single INSERT. bulk_create skips Message.save,
+        # so no webhook fires and the conversation timestamp is not bumped.
+        Message.objects.bulk_create([
+            Message(
+                conversation=self.conversation,
+                sender=self.farmer_user,
+                content="Yes, it's available!"
+            ),
+            Message(
+                conversation=self.conversation,
+                sender=self.buyer,
+                content="Great! How can I order?"
+            ),
+        ], batch_size=500)
+
+        # Evaluate once and count the fetched rows rather than issuing a COUNT
+        messages = list(self.conversation.messages.select_related('sender'))
+        self.assertEqual(len(messages), 3)
+
+        for msg in messages:
+            self.assertIn(msg.sender, [self.buyer, self.farmer_user])
+
+    def test_conversation_list_query_count(self):
+        # Unread counts and last-message previews are loaded by the list
+        # query itself, so more conversations must not mean more queries
+        cache.clear()
+        self.client.force_login(self.farmer_user)
+        url = reverse('conversation-list')
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+
+        # Cached counts are invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                buyer = User.objects.create(username=f'otherbuyer{i}', user_type='buyer')
+                conversation = Conversation.objects.create(
+                    buyer=buyer,
+                    farmer=self.farmer_user,
+                    product=self.product
+                )
+                Message.objects.create(
+                    conversation=conversation,
+                    sender=buyer,
+                    content="Do you deliver?"
+                )
+
+        with CaptureQueriesContext(connection) as several:
+            response = self.client.get(url)
+
+        self.assertEqual(len(several), len(single))
+        conversations = response.context['conversations']
+        self.assertEqual(len(conversations), 4)
+        self.assertEqual(sum(c.unread_messages for c in conversations), 4)
+
+    def test_conversation_list_ignores_stale_cached_count(self):
+        # A count cached by another worker before the conversation existed
+        # must not hide it
+        cache.clear()
+        cache.set(conversation_count_key(self.farmer_user.id), 0)
+        self.client.force_login(self.farmer_user)
+        response = self.client.get(reverse('conversation-list'))
+        self.assertEqual(list(response.context['conversations']), [self.conversation])
+        self.assertEqual(response.context['paginator'].count, 1)
+
+    def test_conversation_list_etag_tracks_inbox(self):
+        # No on-commit callbacks run here, as for a worker other than the
+        # one that saved the message; the ETag must change all the same
+        self.client.force_login(self.farmer_user)
+        url = reverse('conversation-list')
+        etag = self.client.get(url)['ETag']
+
+        Message.objects.create(
+            conversation=self.conversation,
+            sender=self.buyer,
+            content="Are you there?"
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['conversations'][0].unread_messages, 2)
+
+    def test_conversation_list_etag_changes_on_login(self):
+        # The cached page carries CSRF tokens, so a new session must not
+        # be answered with a 304 for a page rendered in the old one
+        cache.clear()
+        url = reverse('conversation-list')
+        self.client.force_login(self.farmer_user)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.logout()
+        self.client.force_login(self.farmer_user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unread_counter_tracks_new_messages(self):
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_farmer, 1)
+        self.assertEqual(self.conversation.unread_for_buyer, 0)
+
+        Message.objects.create(
+            conversation=self.conversation,
+            sender=self.farmer_user,
+            content="Yes, it's available!"
+        )
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_buyer, 1)
+        self.assertEqual(self.conversation.unread_for_farmer, 1)
+
+    def test_mark_as_read_decrements_counter(self):
+        self.message.mark_as_read()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_farmer, 0)
+
+        # Marking again must not push the counter below zero
+        self.message.is_read = False
+        self.message.mark_as_read()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_farmer, 0)
+
+    def test_mark_read_updates_counter(self):
+        self.conversation.messages.filter(is_read=False).mark_read(self.farmer_user)
+
+        self.message.refresh_from_db()
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.message.is_read)
+        self.assertEqual(self.conversation.unread_for_farmer, 0)
+
+    def test_conversation_detail_resets_counter(self):
+        self.client.force_login(self.farmer_user)
+        self.client.get(reverse('conversation-detail', kwargs={'pk': self.conversation.pk}))
+
+        self.message.refresh_from_db()
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.message.is_read)
+        self.assertEqual(self.conversation.unread_for_farmer, 0)
+
+    def test_conversation_detail_keeps_message_sent_meanwhile(self):
+        # A message arriving after the thread was read but before the
+        # counter is updated is still unread and must stay counted
+        mark_read = MessageQuerySet.mark_read
+
+        def mark_read_after_new_message(queryset, user):
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.buyer,
+                content="Still there?"
+            )
+            return mark_read(queryset, user)
+
+        self.client.force_login(self.farmer_user)
+        with mock.patch.object(MessageQuerySet, 'mark_read', mark_read_after_new_message):
+            self.client.get(reverse('conversation-detail', kwargs={'pk': self.conversation.pk}))
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_farmer, 1)
+        self.assertEqual(self.conversation.unread_count(self.farmer_user), 1)
+
+    def test_unread_counter_backfill(self):
+        migration = import_module('users.migrations.0011_conversation_unread_for_buyer_and_more')
+        Message.objects.create(
+            conversation=self.conversation,
+            sender=self.farmer_user,
+            content="Yes, it's available!",
+            is_read=True
+        )
+        Conversation.objects.update(unread_for_buyer=5, unread_for_farmer=0)
+
+        migration.backfill_unread_counters(apps, None)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unread_for_farmer, 1)
+        self.assertEqual(self.conversation.unread_for_buyer, 0)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models.functions import Substr
 from .models import User, FarmerProfile, Category, Product, Order, Conversation, Message
 
 admin.site.register(User)
@@ -13,12 +14,10 @@ class ConversationAdmin(admin.ModelAdmin):
     list_display = ['id', 'buyer', 'farmer', 'product', 'created_at', 'updated_at']
     list_filter = ['created_at', 'product']
     search_fields = ['buyer__username', 'farmer__username', 'product__name']
-    readonly_fields = ['created_at', 'updated_at']
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related(
-            'buyer', 'farmer', 'product'
-        )
+    readonly_fields = ['created_at', 'updated_at', 'unread_for_buyer', 'unread_for_farmer']
+    raw_id_fields = ['buyer', 'farmer', 'product']
+    list_select_related = ['buyer', 'farmer', 'product']
+    show_full_result_count = False
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -26,12 +25,19 @@ class MessageAdmin(admin.ModelAdmin):
     list_filter = ['timestamp', 'is_read']
     search_fields = ['sender__username', 'content']
     readonly_fields = ['timestamp']
+    raw_id_fields = ['conversation', 'sender']
+    list_select_related = [
+        'conversation__buyer', 'conversation__farmer', 'conversation__product', 'sender'
+    ]
+    show_full_result_count = False
     
+    def get_queryset(self, request):
+        # One character past the preview length tells us whether to add '...'
+        return super().get_queryset(request).annotate(
+            _content_preview=Substr('content', 1, 51)
+        ).defer('content')
+
     def content_preview(self, obj):
-        return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
+        preview = obj._content_preview
+        return preview[:50] + '...' if len(preview) > 50 else preview
     content_preview.short_description = 'Content'
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related(
-            'conversation', 'sender', 'conversation__buyer', 'conversation__farmer'
-        )
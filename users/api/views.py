@@ -1,21 +1,32 @@
 """
 API endpoints for n8n automation integration
 """
+import hmac
 import json
 import logging
+from datetime import datetime, timezone
 
 from django.conf import settings
 from django.http import JsonResponse
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.shortcuts import get_object_or_404
 
 from users.models import Conversation, Message
 
 
 logger = logging.getLogger(__name__)
 
+# Bound once at import instead of going through LazySettings per request
+_SECRET = settings.N8N_SECRET_KEY.encode()
+_N8N_ENABLED = settings.N8N_ENABLED
+
+
+def _has_valid_secret(request):
+    """Constant-time check of the X-AUTO-SECRET header"""
+    secret_header = request.headers.get('X-AUTO-SECRET')
+    return bool(secret_header) and hmac.compare_digest(secret_header.encode(), _SECRET)
+
 
 class SendAutoMessageView(View):
     """
@@ -29,8 +40,7 @@ class SendAutoMessageView(View):
     
     def post(self, request):
         # Validate secret header
-        secret_header = request.headers.get('X-AUTO-SECRET')
-        if not secret_header or secret_header != settings.N8N_SECRET_KEY:
+        if not _has_valid_secret(request):
             logger.warning("Unauthorized attempt to send auto-message")
             return JsonResponse(
                 {'error': 'Unauthorized'},
@@ -50,8 +60,16 @@ class SendAutoMessageView(View):
                     status=400
                 )
             
-            # Get conversation
-            conversation = get_object_or_404(Conversation, pk=conversation_id)
+            # Get conversation with the farmer joined in the same query
+            try:
+                conversation = Conversation.objects.select_related('farmer').only(
+                    'id', 'buyer', 'farmer__username'
+                ).get(pk=conversation_id)
+            except Conversation.DoesNotExist:
+                return JsonResponse(
+                    {'error': 'Conversation not found'},
+                    status=404
+                )
             
             # Create automated message from farmer
             message = Message.objects.create(
@@ -61,18 +79,20 @@ class SendAutoMessageView(View):
                 is_automated=True
             )
             
-            logger.info(
-                f"Automated message created for conversation {conversation_id} "
-                f"from farmer {conversation.farmer.username}"
-            )
-            
-            return JsonResponse({
+            response = JsonResponse({
                 'success': True,
                 'message_id': message.id,
                 'conversation_id': conversation_id,
                 'content': content,
                 'timestamp': message.timestamp.isoformat()
             }, status=201)
+
+            logger.info(
+                f"Automated message created for conversation {conversation_id} "
+                f"from farmer {conversation.farmer.username}"
+            )
+
+            return response
             
         except json.JSONDecodeError:
             logger.error("Invalid JSON in auto-message request")
@@ -92,8 +112,7 @@ class HealthCheckView(View):
     """Health check endpoint for n8n to verify API availability"""
     
     def get(self, request):
-        secret_header = request.headers.get('X-AUTO-SECRET')
-        if not secret_header or secret_header != settings.N8N_SECRET_KEY:
+        if not _has_valid_secret(request):
             return JsonResponse(
                 {'error': 'Unauthorized'},
                 status=401
@@ -101,6 +120,6 @@ class HealthCheckView(View):
         
         return JsonResponse({
             'status': 'healthy',
-            'n8n_enabled': settings.N8N_ENABLED,
-            'timestamp': __import__('datetime').datetime.now().isoformat()
+            'n8n_enabled': _N8N_ENABLED,
+            'timestamp': datetime.now(timezone.utc).isoformat()
         })
@@ -0,0 +1,45 @@
+"""
+Cache keys shared by views and signal handlers.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _delete_on_commit(keys):
+    # Deleting before commit would let a concurrent request re-cache the
+    # old value until the timeout; outside a transaction this runs at once
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+CONVERSATION_COUNT_TIMEOUT = 60
+
+
+def conversation_count_key(user_id):
+    return f"conv_count_{user_id}"
+
+
+def invalidate_conversation_count(*user_ids):
+    _delete_on_commit([conversation_count_key(user_id) for user_id in user_ids])
+
+
+# Order counts for the paginated buyer/farmer order lists. Farmer counts are
+# keyed by FarmerProfile id and cleared at checkout. A count left stale (other
+# item edits such as the admin, or another worker's cache) never hides orders:
+# CachedCountPaginator corrects it from the rows of the page it serves.
+ORDER_COUNT_TIMEOUT = 60
+
+
+def buyer_order_count_key(user_id):
+    return f"buyer_order_count_{user_id}"
+
+
+def farmer_order_count_key(farmer_id):
+    return f"farmer_order_count_{farmer_id}"
+
+
+def invalidate_buyer_order_count(*user_ids):
+    _delete_on_commit([buyer_order_count_key(user_id) for user_id in user_ids])
+
+
+def invalidate_farmer_order_count(*farmer_ids):
+    _delete_on_commit([farmer_order_count_key(farmer_id) for farmer_id in farmer_ids])
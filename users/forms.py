@@ -1,8 +1,52 @@
+import time
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.forms.models import ModelChoiceIterator
 from .models import User, Product, Review, Category
 
 
+# Shared Tailwind classes for form widgets
+_INPUT_CLS = 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500'
+_SELECT_CLS = _INPUT_CLS + ' bg-white'
+_FILE_CLS = 'w-full text-sm'
+
+
+# Per-process category list for ProductForm and the marketplace filter,
+# reset by Category signals. The timeout bounds staleness in other worker processes.
+CATEGORY_CACHE_TIMEOUT = 300
+_CATEGORY_CACHE = None
+
+
+def get_cached_categories():
+    global _CATEGORY_CACHE
+    if _CATEGORY_CACHE is None or time.monotonic() - _CATEGORY_CACHE[0] > CATEGORY_CACHE_TIMEOUT:
+        _CATEGORY_CACHE = (time.monotonic(), list(Category.objects.order_by('name')))
+    return _CATEGORY_CACHE[1]
+
+
+def reset_category_cache():
+    global _CATEGORY_CACHE
+    _CATEGORY_CACHE = None
+
+
+class CachedCategoryIterator(ModelChoiceIterator):
+    """Render category choices from the cached list instead of querying"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in get_cached_categories():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(get_cached_categories()) + (self.field.empty_label is not None)
+
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    iterator = CachedCategoryIterator
+
+
 # -----------------------
 # CUSTOM USER REGISTRATION FORM
 # -----------------------
@@ -19,24 +63,12 @@ class CustomUserCreationForm(UserCreationForm):
             'password2'
         ]
         widgets = {
-            'username': forms.TextInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm',
-            }),
-            'email': forms.EmailInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm',
-            }),
-            'phone': forms.TextInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm',
-            }),
-            'user_type': forms.Select(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm bg-white',
-            }),
-            'password1': forms.PasswordInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm',
-            }),
-            'password2': forms.PasswordInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 focus:border-emerald-500 focus:ring-emerald-500 text-sm',
-            }),
+            'username': forms.TextInput(attrs={'class': _INPUT_CLS}),
+            'email': forms.EmailInput(attrs={'class': _INPUT_CLS}),
+            'phone': forms.TextInput(attrs={'class': _INPUT_CLS}),
+            'user_type': forms.Select(attrs={'class': _SELECT_CLS}),
+            'password1': forms.PasswordInput(attrs={'class': _INPUT_CLS}),
+            'password2': forms.PasswordInput(attrs={'class': _INPUT_CLS}),
         }
 
     def save(self, commit=True):
@@ -54,12 +86,10 @@ class CustomUserCreationForm(UserCreationForm):
 # -----------------------
 
 class ProductForm(forms.ModelForm):
-    category = forms.ModelChoiceField(
+    category = CategoryChoiceField(
         queryset=Category.objects.all().order_by('name'),
         empty_label="Select Category",
-        widget=forms.Select(attrs={
-            'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500 bg-white',
-        })
+        widget=forms.Select(attrs={'class': _SELECT_CLS})
     )
     
     class Meta:
@@ -73,24 +103,20 @@ class ProductForm(forms.ModelForm):
             'image'
         ]
         widgets = {
-            'name': forms.TextInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
-            }),
+            'name': forms.TextInput(attrs={'class': _INPUT_CLS}),
             'description': forms.Textarea(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
+                'class': _INPUT_CLS,
                 'rows': 3,
             }),
             'price': forms.NumberInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
+                'class': _INPUT_CLS,
                 'step': '0.01',
             }),
             'quantity_available': forms.NumberInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
+                'class': _INPUT_CLS,
                 'min': '0',
             }),
-            'image': forms.ClearableFileInput(attrs={
-                'class': 'w-full text-sm',
-            }),
+            'image': forms.ClearableFileInput(attrs={'class': _FILE_CLS}),
         }
 
 
@@ -104,12 +130,12 @@ class ReviewForm(forms.ModelForm):
         fields = ['rating', 'comment']
         widgets = {
             'rating': forms.NumberInput(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
+                'class': _INPUT_CLS,
                 'min': '1',
                 'max': '5',
             }),
             'comment': forms.Textarea(attrs={
-                'class': 'w-full rounded-xl border-slate-200 text-sm focus:border-emerald-500 focus:ring-emerald-500',
+                'class': _INPUT_CLS,
                 'rows': 3,
             }),
         }
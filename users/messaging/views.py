@@ -8,14 +8,24 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
+from django.utils.crypto import salted_hmac
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import condition
 from django.views.generic import CreateView, DetailView, ListView
-from django.http import Http404
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
 
+from users.caching import (
+    CONVERSATION_COUNT_TIMEOUT,
+    conversation_count_key,
+)
 from users.models import Conversation, Message, Product, FarmerProfile
+from users.pagination import CachedCountPaginator
 
 
 logger = logging.getLogger(__name__)
@@ -31,10 +41,13 @@ class ConversationAccessMixin(LoginRequiredMixin):
     def get_conversation(self):
         if not hasattr(self, 'conversation'):
             pk = self.kwargs.get('pk')
-            self.conversation = get_object_or_404(Conversation, pk=pk)
+            self.conversation = get_object_or_404(
+                Conversation.objects.select_related('buyer', 'farmer', 'product'),
+                pk=pk
+            )
             
-            # Security check: user must be participant
-            if self.request.user not in [self.conversation.buyer, self.conversation.farmer]:
+            # Security check: user must be participant (compared by FK id)
+            if self.request.user.id not in (self.conversation.buyer_id, self.conversation.farmer_id):
                 raise PermissionDenied("You don't have access to this conversation.")
         
         return self.conversation
@@ -62,35 +75,87 @@ class FarmerRequiredMixin(LoginRequiredMixin):
 # CONVERSATION LIST VIEW
 # ==========================
 
+def _inbox_stamp(user):
+    """
+    Fingerprint of a user's inbox: conversation count, total unread and
+    latest activity. One indexed aggregate, computed on every request
+    rather than cached: a per-process cache would keep answering 304 on
+    workers that never saw the change.
+    """
+    participant = 'buyer' if user.user_type == 'buyer' else 'farmer'
+    inbox = Conversation.objects.filter(**{participant: user}).aggregate(
+        total=Count('id'),
+        unread=Sum(f'unread_for_{participant}'),
+        latest=Max('updated_at'),
+    )
+    latest = inbox['latest'].timestamp() if inbox['latest'] else 0
+    return f"{inbox['total']}-{inbox['unread'] or 0}-{latest}"
+
+
+def _inbox_etag(request, *args, **kwargs):
+    user = request.user
+    if not user.is_authenticated or user.user_type not in ('buyer', 'farmer'):
+        return None
+    # Pending flash messages must be rendered, not answered with a 304
+    if len(messages.get_messages(request)):
+        return None
+    # The page embeds CSRF tokens, so a cached copy must not outlive the
+    # session; the session key rotates on login
+    session = salted_hmac(
+        'inbox-etag', request.session.session_key or ''
+    ).hexdigest()[:16]
+    return f"{user.id}-{session}-{request.GET.get('page', '1')}-{_inbox_stamp(user)}"
+
+
+@method_decorator(condition(etag_func=_inbox_etag), name='dispatch')
 class ConversationListView(LoginRequiredMixin, ListView):
     model = Conversation
     template_name = 'messages/conversation_list.html'
     context_object_name = 'conversations'
     paginate_by = 20
+    paginator_class = CachedCountPaginator
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return super().get_paginator(
+            queryset,
+            per_page,
+            cache_key=conversation_count_key(self.request.user.id),
+            cache_timeout=CONVERSATION_COUNT_TIMEOUT,
+            **kwargs
+        )
 
     def get_queryset(self):
         user = self.request.user
         
         if user.user_type == 'buyer':
-            return Conversation.objects.filter(buyer=user).select_related(
-                'farmer', 'product', 'product__farmer', 'product__category'
-            ).prefetch_related('messages')
+            queryset = Conversation.objects.filter(buyer=user).select_related(
+                'farmer', 'product'
+            ).only(
+                'id', 'created_at', 'updated_at', 'farmer__username', 'product__name'
+            )
+            unread_counter = 'unread_for_buyer'
         elif user.user_type == 'farmer':
-            return Conversation.objects.filter(farmer=user).select_related(
-                'buyer', 'product', 'product__farmer', 'product__category'
-            ).prefetch_related('messages')
+            queryset = Conversation.objects.filter(farmer=user).select_related(
+                'buyer', 'product'
+            ).only(
+                'id', 'created_at', 'updated_at', 'buyer__username', 'product__name'
+            )
+            unread_counter = 'unread_for_farmer'
         else:
             return Conversation.objects.none()
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Add unread counts
-        conversations = context['conversations']
-        for conv in conversations:
-            conv.unread_messages = conv.unread_count(self.request.user)
-        
-        return context
+        # Only the columns rendered by the list template are loaded; the
+        # unread count comes from the denormalized counter and the
+        # last-message preview from correlated subqueries
+        last_message = Message.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-timestamp')
+        return queryset.annotate(
+            unread_messages=F(unread_counter),
+            last_message_content=Subquery(last_message.values('content')[:1]),
+            last_message_sender_id=Subquery(last_message.values('sender_id')[:1]),
+            last_message_time=Subquery(last_message.values('timestamp')[:1]),
+        )
 
 
 # ==========================
@@ -109,16 +174,31 @@ class ConversationDetailView(ConversationAccessMixin, DetailView):
         context = super().get_context_data(**kwargs)
         conversation = context['conversation']
         
-        # Mark unread messages as read
-        unread_messages = conversation.messages.filter(
-            is_read=False
-        ).exclude(sender=self.request.user)
-        
-        for message in unread_messages:
-            message.mark_as_read()
-        
-        # Get messages for display
-        context['messages'] = conversation.messages.all().select_related('sender')
+        # Read the thread once; the UPDATE only runs when something in it
+        # is unread, targeting those rows by id
+        thread = list(
+            conversation.messages.select_related('sender').order_by('timestamp')
+        )
+        unread = [
+            message for message in thread
+            if not message.is_read and message.sender_id != self.request.user.id
+        ]
+
+        # mark_read recounts the user's unread counter from the messages
+        # still unread, so one arriving meanwhile stays counted
+        if unread:
+            Message.objects.filter(
+                id__in=[message.id for message in unread]
+            ).mark_read(self.request.user)
+            for message in unread:
+                message.is_read = True
+        elif getattr(conversation, conversation.unread_counter_for(self.request.user.id)):
+            # Nothing to mark but the counter drifted; recount it
+            Conversation.objects.filter(
+                pk=conversation.pk
+            ).refresh_unread(self.request.user)
+
+        context['messages'] = thread
         
         # Determine if current user is buyer or farmer
         context['is_buyer'] = self.request.user == conversation.buyer
@@ -165,7 +245,7 @@ class CreateConversationView(BuyerRequiredMixin, CreateView):
             return self.get(request, *args, **kwargs)
         
         # Check if conversation already exists
-        conversation, created = Conversation.objects.get_or_create(
+        conversation, created = Conversation.objects.upsert(
             buyer=request.user,
             farmer=self.farmer,
             product=self.product
@@ -190,23 +270,41 @@ class CreateConversationView(BuyerRequiredMixin, CreateView):
 # MESSAGE CREATE VIEW
 # ==========================
 
+def _wants_json(request):
+    return (
+        request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('Accept', '')
+    )
+
+
 class MessageCreateView(ConversationAccessMixin, View):
     """Handle message creation via POST"""
     
     def post(self, request, pk):
         conversation = self.get_conversation()
         message_content = request.POST.get('message', '').strip()
+        wants_json = _wants_json(request)
         
         if not message_content:
+            if wants_json:
+                return JsonResponse({'error': "Please enter a message."}, status=400)
             messages.error(request, "Please enter a message.")
             return redirect('conversation-detail', pk=conversation.pk)
         
         # Create message
-        Message.objects.create(
+        message = Message.objects.create(
             conversation=conversation,
             sender=request.user,
             content=message_content
         )
+
+        # Background sends get the rendered bubble to append, rather than
+        # a redirect that re-renders the whole conversation
+        if wants_json:
+            html = render_to_string(
+                'messages/_message.html', {'message': message}, request=request
+            )
+            return JsonResponse({'id': message.id, 'html': html}, status=201)
         
         messages.success(request, "Message sent!")
         return redirect('conversation-detail', pk=conversation.pk)
@@ -233,7 +331,7 @@ def start_product_conversation(request, product_id):
         raise PermissionDenied("You cannot message yourself.")
     
     # Get or create conversation
-    conversation, created = Conversation.objects.get_or_create(
+    conversation, created = Conversation.objects.upsert(
         buyer=request.user,
         farmer=farmer,
         product=product
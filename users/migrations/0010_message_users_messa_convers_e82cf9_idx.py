@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_message_is_automated_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'is_read'], name='users_messa_convers_e82cf9_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-15 01:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Conversation = apps.get_model('users', 'Conversation')
+    Message = apps.get_model('users', 'Message')
+
+    def unread_from(sender):
+        return Coalesce(
+            Subquery(
+                Message.objects.filter(
+                    conversation=OuterRef('pk'), is_read=False, sender=OuterRef(sender)
+                ).order_by().values('conversation').annotate(n=Count('pk')).values('n')
+            ),
+            Value(0),
+        )
+
+    Conversation.objects.update(
+        unread_for_buyer=unread_from('farmer'),
+        unread_for_farmer=unread_from('buyer'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_message_users_messa_convers_e82cf9_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='unread_for_buyer',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='unread_for_farmer',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-15 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_conversation_unread_for_buyer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'status'], name='order_buyer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', '-created_at'], name='order_buyer_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_product_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(check=models.Q(('buyer', models.F('farmer')), _negated=True), name='conv_buyer_ne_farmer', violation_error_message='Buyer and farmer cannot be the same user.'),
+        ),
+    ]
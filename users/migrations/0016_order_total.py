@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-15 01:55
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('users', 'Order')
+    OrderItem = apps.get_model('users', 'OrderItem')
+
+    items_total = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(t=Sum(F('quantity') * F('price_at_time')))
+        .values('t')
+    )
+    Order.objects.update(
+        total=Coalesce(
+            Subquery(items_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_conversation_conv_buyer_ne_farmer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-15 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_order_total'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='conversation',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('buyer', 'farmer', 'product'), name='unique_conversation_per_buyer_farmer_product'),
+        ),
+    ]
@@ -1,6 +1,13 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 # ==========================
@@ -63,9 +70,30 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    # The review helpers prefer the avg_rating / review_count annotations and
+    # only query when those are missing. A prefetched 'reviews' list may be
+    # capped (see PublicProductDetailView), so its length is not used.
+
+    @cached_property
+    def cached_review_count(self):
+        if hasattr(self, 'review_count'):
+            return self.review_count
+        return self.reviews.count()
+
+    @cached_property
+    def cached_avg_rating(self):
+        if hasattr(self, 'avg_rating'):
+            return self.avg_rating
+        return self.reviews.aggregate(avg=Avg('rating'))['avg']
+
 
 # ==========================
 # ORDER
@@ -87,10 +115,36 @@ class Order(models.Model):
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized sum of the items: set at checkout, kept in sync by the
+    # OrderItem signals through recompute_total()
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', 'status'], name='order_buyer_status_idx'),
+            models.Index(fields=['buyer', '-created_at'], name='order_buyer_created_idx'),
+        ]
 
     @property
     def total_amount(self):
-        return sum(item.subtotal() for item in self.items.all())
+        return self.total
+
+    @classmethod
+    def recompute_total(cls, order_id):
+        """Recalculate the stored total from the order's items in one UPDATE"""
+        items_total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(t=Sum(F('quantity') * F('price_at_time')))
+            .values('t')
+        )
+        cls.objects.filter(pk=order_id).update(
+            total=Coalesce(
+                Subquery(items_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+            )
+        )
 
     def __str__(self):
         return f"Order #{self.id}"
@@ -106,6 +160,11 @@ class OrderItem(models.Model):
     quantity = models.IntegerField()
     price_at_time = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
     def clean(self):
         if self.quantity > self.product.quantity_available:
             raise ValidationError("Not enough stock available.")
@@ -144,8 +203,10 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        # Automatically set payment amount to order total
-        self.amount = self.order.total_amount
+        # Default the payment amount to the order total when the caller
+        # has not already computed it
+        if self.amount is None:
+            self.amount = self.order.total_amount
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -180,6 +241,73 @@ class Review(models.Model):
 # MESSAGING SYSTEM
 # ==========================
 
+class ConversationQuerySet(models.QuerySet):
+    def upsert(self, buyer, farmer, product):
+        """
+        get_or_create() for a buyer/farmer/product conversation. On PostgreSQL
+        this is one INSERT ... ON CONFLICT statement instead of a SELECT, then
+        a SAVEPOINT and INSERT on a miss. Returns (conversation, created).
+        """
+        connection = connections[self.db]
+        # NULL products never conflict, so only the full key can be upserted
+        if connection.vendor != 'postgresql' or product is None:
+            return self.get_or_create(buyer=buyer, farmer=farmer, product=product)
+
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {connection.ops.quote_name(self.model._meta.db_table)}
+                    (buyer_id, farmer_id, product_id, created_at, updated_at,
+                     unread_for_buyer, unread_for_farmer)
+                VALUES (%s, %s, %s, %s, %s, 0, 0)
+                ON CONFLICT (buyer_id, farmer_id, product_id)
+                DO UPDATE SET buyer_id = EXCLUDED.buyer_id
+                RETURNING id, created_at, updated_at, unread_for_buyer, unread_for_farmer,
+                    (xmax = 0)
+                """,
+                [buyer.pk, farmer.pk, product.pk, now, now],
+            )
+            pk, created_at, updated_at, unread_for_buyer, unread_for_farmer, created = cursor.fetchone()
+
+        conversation = self.model(
+            id=pk,
+            buyer=buyer,
+            farmer=farmer,
+            product=product,
+            created_at=created_at,
+            updated_at=updated_at,
+            unread_for_buyer=unread_for_buyer,
+            unread_for_farmer=unread_for_farmer,
+        )
+        conversation._state.adding = False
+        conversation._state.db = self.db
+        if created:
+            # The raw INSERT bypasses save(); let the cache handlers know
+            post_save.send(
+                sender=self.model, instance=conversation, created=True,
+                update_fields=None, raw=False, using=self.db,
+            )
+        return conversation, created
+
+    def refresh_unread(self, user):
+        """
+        Set the user's unread counter on these conversations to the number
+        of messages still unread for them, in a single UPDATE. Unlike
+        resetting it to zero, this keeps messages that arrived after the
+        caller last read the thread.
+        """
+        participant = 'buyer' if user.user_type == 'buyer' else 'farmer'
+        still_unread = Message.objects.filter(
+            conversation=OuterRef('pk'), is_read=False
+        ).exclude(sender=user).order_by().values('conversation').annotate(
+            n=Count('pk')
+        ).values('n')
+        return self.filter(**{participant: user}).update(**{
+            f'unread_for_{participant}': Coalesce(Subquery(still_unread), Value(0)),
+        })
+
+
 class Conversation(models.Model):
     buyer = models.ForeignKey(
         'User', 
@@ -202,24 +330,38 @@ class Conversation(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized unread counters, maintained by Message.save and mark-as-read
+    unread_for_buyer = models.PositiveIntegerField(default=0)
+    unread_for_farmer = models.PositiveIntegerField(default=0)
+
+    objects = ConversationQuerySet.as_manager()
 
     class Meta:
-        unique_together = ("buyer", "farmer", "product")
         ordering = ['-updated_at']
         indexes = [
             models.Index(fields=['buyer', '-updated_at']),
             models.Index(fields=['farmer', '-updated_at']),
             models.Index(fields=['product']),
         ]
+        constraints = [
+            # Also the conflict target of ConversationQuerySet.upsert()
+            models.UniqueConstraint(
+                fields=['buyer', 'farmer', 'product'],
+                name='unique_conversation_per_buyer_farmer_product',
+            ),
+            models.CheckConstraint(
+                check=~models.Q(buyer=F('farmer')),
+                name='conv_buyer_ne_farmer',
+                violation_error_message="Buyer and farmer cannot be the same user.",
+            ),
+        ]
 
     def __str__(self):
         product_name = f" about {self.product.name}" if self.product else ""
         return f"Conversation: {self.buyer.username} ↔ {self.farmer.username}{product_name}"
 
     def clean(self):
-        if self.buyer == self.farmer:
-            raise ValidationError("Buyer and farmer cannot be the same user.")
-        
+        # buyer != farmer is enforced by the conv_buyer_ne_farmer constraint
         if self.buyer.user_type != 'buyer':
             raise ValidationError("First participant must be a buyer.")
         
@@ -234,6 +376,10 @@ class Conversation(models.Model):
             return self.buyer
         return None
 
+    def unread_counter_for(self, user_id):
+        """Name of the counter holding unread messages addressed to user_id"""
+        return 'unread_for_buyer' if user_id == self.buyer_id else 'unread_for_farmer'
+
     @property
     def last_message(self):
         """Get the most recent message"""
@@ -244,6 +390,26 @@ class Conversation(models.Model):
         return self.messages.filter(is_read=False).exclude(sender=user).count()
 
 
+class MessageQuerySet(models.QuerySet):
+    def mark_read(self, user):
+        """
+        Mark messages addressed to user as read in a single UPDATE, then
+        recount the user's unread counter on the conversations they belong to
+        """
+        unread = self.filter(is_read=False).exclude(sender=user)
+        # Collected first: the caller's filters may no longer match afterwards
+        rows = list(unread.values_list('pk', 'conversation_id'))
+        if not rows:
+            return 0
+
+        with transaction.atomic(using=self.db):
+            updated = unread.filter(pk__in=[pk for pk, _ in rows]).update(is_read=True)
+            Conversation.objects.filter(
+                pk__in={conversation_id for _, conversation_id in rows}
+            ).refresh_unread(user)
+        return updated
+
+
 class Message(models.Model):
     conversation = models.ForeignKey(
         Conversation, 
@@ -256,10 +422,13 @@ class Message(models.Model):
     is_read = models.BooleanField(default=False)
     is_automated = models.BooleanField(default=False, db_index=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ["timestamp"]
         indexes = [
             models.Index(fields=['conversation', 'timestamp']),
+            models.Index(fields=['conversation', 'is_read']),
             models.Index(fields=['sender']),
             models.Index(fields=['is_read']),
             models.Index(fields=['is_automated']),
@@ -270,16 +439,24 @@ class Message(models.Model):
 
     def clean(self):
         # Validate sender is part of the conversation
-        if self.sender not in [self.conversation.buyer, self.conversation.farmer]:
+        if self.sender_id not in (self.conversation.buyer_id, self.conversation.farmer_id):
             raise ValidationError("Sender must be a participant in the conversation.")
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        self.full_clean()
+        # Only the membership check; callers already reject empty content
+        self.clean()
         super().save(*args, **kwargs)
-        
-        # Update conversation timestamp
-        self.conversation.save()
+
+        # Bump the conversation timestamp, and for a new unread message the
+        # recipient's counter, in a single UPDATE
+        now = timezone.now()
+        changes = {'updated_at': now}
+        if is_new and not self.is_read:
+            counter = self.unread_counter
+            changes[counter] = F(counter) + 1
+        Conversation.objects.filter(pk=self.conversation_id).update(**changes)
+        self.conversation.updated_at = now
         
         # Trigger n8n webhook for new buyer messages
         if is_new and not self.is_automated:
@@ -292,6 +469,18 @@ class Message(models.Model):
             self.is_read = True
             super().save(update_fields=['is_read'])
 
+            counter = self.unread_counter
+            Conversation.objects.filter(
+                pk=self.conversation_id, **{f'{counter}__gt': 0}
+            ).update(**{counter: F(counter) - 1})
+
+    @property
+    def unread_counter(self):
+        """Conversation counter this message counts against while unread"""
+        if self.sender_id == self.conversation.buyer_id:
+            return 'unread_for_farmer'
+        return 'unread_for_buyer'
+
     @property
     def is_from_buyer(self):
         """Check if message is from buyer"""
@@ -0,0 +1,159 @@
+"""
+Paginators for the list views.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that stores its total count in the cache under ``cache_key``.
+    Falls back to a normal COUNT query when no key is given or on a miss.
+
+    The cached count may be stale (with LocMemCache every worker holds its
+    own copy), so pages are never cut short by it: each page reads one row
+    past its end and the count is corrected when the rows disagree with it.
+    """
+
+    def __init__(self, *args, cache_key=None, cache_timeout=60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+
+    @cached_property
+    def count(self):
+        if self.cache_key is None:
+            return super().count
+
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.cache_key, count, self.cache_timeout)
+        return count
+
+    def _set_count(self, count):
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+        cache.set(self.cache_key, count, self.cache_timeout)
+
+    def _recount(self):
+        self._set_count(super().count)
+
+    def page(self, number):
+        if self.cache_key is None:
+            return super().page(number)
+
+        try:
+            number = self.validate_number(number)
+        except EmptyPage:
+            # Past the end by the cached count; check against a fresh one
+            self._recount()
+            number = self.validate_number(number)
+
+        bottom = (number - 1) * self.per_page
+        limit = self.per_page + self.orphans
+        rows = list(self.object_list[bottom:bottom + limit + 1])
+
+        if len(rows) > limit:
+            # More rows follow this page, so the count is at least that many
+            rows = rows[:self.per_page]
+            if self.count <= bottom + limit:
+                self._recount()
+        elif rows or number == 1:
+            # Last page: the exact count is known without a COUNT query
+            if self.count != bottom + len(rows):
+                self._set_count(bottom + len(rows))
+        else:
+            # Rows removed since the count was cached
+            self._recount()
+            number = self.validate_number(number)
+
+        return self._get_page(rows, number, self)
+
+
+class KeysetPage:
+    """One page from a KeysetPaginator, with cursors for its neighbours."""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.next_cursor = encode_cursor(object_list[-1]) if has_next else None
+        self.previous_cursor = encode_cursor(object_list[0]) if has_previous else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(obj):
+    return f"{(obj.created_at - _EPOCH) // _MICROSECOND}_{obj.pk}"
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) for a cursor, or None if it is malformed."""
+    try:
+        micros, pk = cursor.split('_')
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class KeysetPaginator:
+    """
+    Seek pagination over ``(created_at, id)``, newest first.
+
+    Pages are addressed by a cursor naming the row just outside them rather
+    than a page number, so a deep page is an index range scan instead of an
+    OFFSET that reads and discards every earlier row. No total count is kept.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def page(self, after=None, before=None):
+        """
+        Return the page following the ``after`` cursor, or preceding the
+        ``before`` cursor. Missing or malformed cursors give the first page.
+        """
+        after, before = decode_cursor(after), decode_cursor(before)
+
+        if before is not None:
+            created_at, pk = before
+            rows = list(
+                self.queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                ).order_by('created_at', 'pk')[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, has_next=bool(rows), has_previous=has_previous)
+
+        queryset = self.queryset.order_by('-created_at', '-pk')
+        if after is not None:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(rows, has_next=has_next, has_previous=after is not None and bool(rows))
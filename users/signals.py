@@ -0,0 +1,48 @@
+"""
+Signal handlers keeping cached values in sync with the database.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import (
+    invalidate_buyer_order_count,
+    invalidate_conversation_count,
+)
+from .forms import reset_category_cache
+from .models import Category, Conversation, Order, OrderItem
+
+
+@receiver(post_save, sender=Conversation)
+def conversation_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_conversation_count(instance.buyer_id, instance.farmer_id)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance, **kwargs):
+    invalidate_conversation_count(instance.buyer_id, instance.farmer_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    reset_category_cache()
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_buyer_order_count(instance.buyer_id)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    invalidate_buyer_order_count(instance.buyer_id)
+
+
+# Checkout sets Order.total directly (its items are bulk-created, which
+# sends no signals); these cover later edits, e.g. through the admin
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    Order.recompute_total(instance.order_id)
@@ -1,3 +1,271 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .caching import buyer_order_count_key, farmer_order_count_key
+from .models import Category, FarmerProfile, Order, OrderItem, Payment, Product, User
+from .views import SESSION_CART_KEY
+from .pagination import CachedCountPaginator, KeysetPaginator, encode_cursor
+
+
+class CachedCountPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.bulk_create([
+            Category(name='fruit'),
+            Category(name='herbs'),
+            Category(name='vegetables'),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def paginator(self, per_page=2):
+        return CachedCountPaginator(
+            Category.objects.order_by('name'), per_page, cache_key='test_count'
+        )
+
+    def test_count_is_cached(self):
+        self.assertEqual(self.paginator().count, 3)
+        self.assertEqual(cache.get('test_count'), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.paginator().count, 3)
+
+    def test_stale_low_count_does_not_hide_rows(self):
+        # Another worker's cache may still hold the count from before the
+        # rows were created
+        cache.set('test_count', 0)
+        page = self.paginator().page(1)
+        self.assertEqual([c.name for c in page], ['fruit', 'herbs'])
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.paginator.count, 3)
+        self.assertEqual(cache.get('test_count'), 3)
+
+        cache.set('test_count', 0)
+        page = self.paginator().page(2)
+        self.assertEqual([c.name for c in page], ['vegetables'])
+        self.assertFalse(page.has_next())
+
+    def test_stale_high_count_is_corrected(self):
+        cache.set('test_count', 10)
+        page = self.paginator().page(2)
+        self.assertEqual([c.name for c in page], ['vegetables'])
+        self.assertEqual(page.paginator.count, 3)
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertEqual(cache.get('test_count'), 3)
+
+        cache.set('test_count', 10)
+        page = self.paginator(per_page=3).page(1)
+        self.assertEqual(len(page), 3)
+        self.assertEqual(page.paginator.count, 3)
+
+    def test_page_past_the_end(self):
+        cache.set('test_count', 10)
+        with self.assertRaises(EmptyPage):
+            self.paginator().page(4)
+        self.assertEqual(cache.get('test_count'), 3)
+
+
+class OrderListCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', password='pw', user_type='buyer')
+        cls.farmer_user = User.objects.create_user('farmer', password='pw', user_type='farmer')
+        cls.farmer_profile = FarmerProfile.objects.create(
+            user=cls.farmer_user, farm_name='Test Farm', location='Test Location'
+        )
+        cls.product = Product.objects.create(
+            farmer=cls.farmer_profile, name='Kale', price='2.50', quantity_available=10
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_orders_shown_despite_stale_count(self):
+        # Counts cached by another worker before the first checkout; its
+        # on-commit invalidation only reaches the worker that took the order
+        cache.set(buyer_order_count_key(self.buyer.id), 0)
+        cache.set(farmer_order_count_key(self.farmer_profile.id), 0)
+        order = Order.objects.create(buyer=self.buyer)
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, price_at_time='2.50'
+        )
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('buyer-orders'))
+        self.assertEqual(list(response.context['orders']), [order])
+
+        self.client.force_login(self.farmer_user)
+        response = self.client.get(reverse('farmer-orders'))
+        self.assertEqual(list(response.context['orders']), [order])
+        self.assertEqual(cache.get(farmer_order_count_key(self.farmer_profile.id)), 1)
+
+
+class CheckoutTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', password='pw', user_type='buyer')
+        cls.farms = []
+        for name in ('north', 'south'):
+            user = User.objects.create_user(name, password='pw', user_type='farmer')
+            cls.farms.append(FarmerProfile.objects.create(
+                user=user, farm_name=f'{name} farm', location='Test Location'
+            ))
+        north, south = cls.farms
+        cls.kale = Product.objects.create(
+            farmer=north, name='Kale', price=Decimal('2.50'), quantity_available=10
+        )
+        cls.corn = Product.objects.create(
+            farmer=north, name='Corn', price=Decimal('1.00'), quantity_available=5
+        )
+        cls.eggs = Product.objects.create(
+            farmer=south, name='Eggs', price=Decimal('4.25'), quantity_available=3
+        )
+
+    def setUp(self):
+        self.client.force_login(self.buyer)
+
+    def set_cart(self, quantities):
+        session = self.client.session
+        session[SESSION_CART_KEY] = {
+            str(product.pk): {'quantity': qty} for product, qty in quantities
+        }
+        session.save()
+
+    def stock(self):
+        return dict(Product.objects.values_list('name', 'quantity_available'))
+
+    def test_checkout_splits_orders_and_decrements_stock(self):
+        self.set_cart([(self.kale, 3), (self.corn, 2), (self.eggs, 3)])
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('buyer-orders'))
+
+        self.assertEqual(self.stock(), {'Kale': 7, 'Corn': 3, 'Eggs': 0})
+
+        # One order per farmer, with its total and payment amount stored
+        north, south = self.farms
+        totals = {}
+        for farm in self.farms:
+            order = Order.objects.filter(items__product__farmer=farm).distinct().get()
+            self.assertEqual(order.status, 'pending')
+            self.assertEqual(order.total, order.total_amount)
+            payment = Payment.objects.get(order=order)
+            self.assertEqual(payment.amount, order.total)
+            self.assertEqual(payment.status, 'pending')
+            totals[farm] = order.total
+        self.assertEqual(totals, {north: Decimal('9.50'), south: Decimal('12.75')})
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 3)
+        self.assertEqual(
+            set(OrderItem.objects.values_list('product__name', 'quantity', 'price_at_time')),
+            {('Kale', 3, Decimal('2.50')), ('Corn', 2, Decimal('1.00')), ('Eggs', 3, Decimal('4.25'))},
+        )
+        self.assertEqual(self.client.session[SESSION_CART_KEY], {})
+
+    def test_checkout_rejects_quantity_over_stock(self):
+        # Stock fell below the cart quantity after the item was added
+        self.set_cart([(self.kale, 2), (self.eggs, 4)])
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(self.stock(), {'Kale': 10, 'Corn': 5, 'Eggs': 3})
+        self.assertEqual(len(self.client.session[SESSION_CART_KEY]), 2)
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('farmer', password='pw', user_type='farmer')
+        farm = FarmerProfile.objects.create(user=user, farm_name='Test Farm', location='Test Location')
+        cls.vegetables = Category.objects.create(name='vegetables')
+        cls.fruit = Category.objects.create(name='fruit')
+        cls.products = Product.objects.bulk_create([
+            Product(
+                farmer=farm, category=cls.vegetables, name=f'Veg {i}',
+                price=Decimal('1.00'), quantity_available=5,
+            )
+            for i in range(5)
+        ])
+        # Oldest first; two products share a timestamp so ties fall to the id
+        now = timezone.now()
+        for minutes, product in zip([50, 40, 30, 30, 10], cls.products):
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - timedelta(minutes=minutes)
+            )
+
+    def paginator(self):
+        return KeysetPaginator(Product.objects.all(), 2)
+
+    def names(self, page):
+        return [product.name for product in page]
+
+    def test_forward_and_back(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        self.assertEqual(self.names(first), ['Veg 4', 'Veg 3'])
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+
+        second = paginator.page(after=first.next_cursor)
+        self.assertEqual(self.names(second), ['Veg 2', 'Veg 1'])
+        self.assertTrue(second.has_previous())
+
+        last = paginator.page(after=second.next_cursor)
+        self.assertEqual(self.names(last), ['Veg 0'])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+        # Going back re-reads ascending from the cursor and reverses
+        back = paginator.page(before=last.previous_cursor)
+        self.assertEqual(self.names(back), ['Veg 2', 'Veg 1'])
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+        self.assertEqual(back.next_cursor, second.next_cursor)
+
+        back = paginator.page(before=back.previous_cursor)
+        self.assertEqual(self.names(back), ['Veg 4', 'Veg 3'])
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_malformed_cursor_gives_first_page(self):
+        paginator = self.paginator()
+        for cursor in ('', 'abc', '1_2_3', 'x_1', f'{10 ** 30}_1'):
+            for page in (paginator.page(after=cursor), paginator.page(before=cursor)):
+                self.assertEqual(self.names(page), ['Veg 4', 'Veg 3'])
+                self.assertFalse(page.has_previous())
+
+    def test_marketplace_keeps_category_across_pages(self):
+        Product.objects.bulk_create([
+            Product(
+                farmer=self.products[0].farmer, category=self.fruit, name=f'Fruit {i}',
+                price=Decimal('1.00'), quantity_available=5,
+            )
+            for i in range(21)
+        ])
+        url = reverse('marketplace')
+        first = self.client.get(url, {'category': self.fruit.pk})
+        page = first.context['page_obj']
+        self.assertEqual(len(page), 20)
+        self.assertContains(
+            first, f'?after={page.next_cursor}&category={self.fruit.pk}'
+        )
 
-# Create your tests here.
+        second = self.client.get(url, {'category': self.fruit.pk, 'after': page.next_cursor})
+        products = list(second.context['products'])
+        self.assertEqual(len(products), 1)
+        self.assertEqual(products[0].category_id, self.fruit.pk)
+        self.assertFalse(second.context['page_obj'].has_next())
+        self.assertEqual(
+            second.context['page_obj'].previous_cursor, encode_cursor(products[0])
+        )
@@ -5,16 +5,26 @@ from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Avg, Prefetch
+from django.db.models import (
+    Avg, Case, Count, Exists, F, IntegerField, OuterRef, Prefetch, Subquery, Value, When,
+)
 from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views import View
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, TemplateView, UpdateView
 from django.urls import reverse_lazy
+from django.utils.functional import cached_property
 
-from .forms import CustomUserCreationForm, ProductForm, ReviewForm
-from .models import Category, FarmerProfile, Order, OrderItem, Payment, Product, Review
+from .caching import (
+    ORDER_COUNT_TIMEOUT,
+    buyer_order_count_key,
+    farmer_order_count_key,
+    invalidate_farmer_order_count,
+)
+from .forms import CustomUserCreationForm, ProductForm, ReviewForm, get_cached_categories
+from .models import FarmerProfile, Order, OrderItem, Payment, Product, Review
+from .pagination import CachedCountPaginator, KeysetPaginator
 
 
 # =====================================================
@@ -64,6 +74,12 @@ class FarmerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
     def test_func(self):
         return self.request.user.user_type == 'farmer'
 
+    @cached_property
+    def farmer_profile(self):
+        # Loaded once per request and shared by get_object/get_context_data
+        return self.request.user.farmerprofile
+
+
 class BuyerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
     def test_func(self):
         return self.request.user.user_type == 'buyer'
@@ -80,8 +96,7 @@ class ProductCreateView(FarmerRequiredMixin, CreateView):
     success_url = reverse_lazy('farmer-products')
 
     def form_valid(self, form):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
-        form.instance.farmer = farmer_profile
+        form.instance.farmer = self.farmer_profile
         return super().form_valid(form)
 
 
@@ -95,8 +110,7 @@ class ProductListView(FarmerRequiredMixin, ListView):
     context_object_name = 'products'
 
     def get_queryset(self):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
-        return Product.objects.filter(farmer=farmer_profile)
+        return Product.objects.filter(farmer__user=self.request.user)
 
 
 # =====================================================
@@ -110,8 +124,7 @@ class ProductUpdateView(FarmerRequiredMixin, UpdateView):
     success_url = reverse_lazy('farmer-products')
 
     def get_queryset(self):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
-        return Product.objects.filter(farmer=farmer_profile)
+        return Product.objects.filter(farmer__user=self.request.user)
 
 
 # =====================================================
@@ -124,8 +137,7 @@ class ProductDeleteView(FarmerRequiredMixin, DeleteView):
     success_url = reverse_lazy('farmer-products')
 
     def get_queryset(self):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
-        return Product.objects.filter(farmer=farmer_profile)
+        return Product.objects.filter(farmer__user=self.request.user)
 
 
 # =====================================================
@@ -139,47 +151,93 @@ class PublicProductListView(ListView):
     paginate_by = 20
 
     def get_queryset(self):
+        # Only the columns the product cards render; category and the farmer's
+        # user account aren't shown, so they aren't joined
         qs = (
             Product.objects.filter(quantity_available__gt=0)
-            .select_related('category', 'farmer', 'farmer__user')
-            .order_by('-created_at')
+            .select_related('farmer')
+            .only(
+                'id', 'name', 'price', 'quantity_available', 'image', 'created_at',
+                'farmer__farm_name',
+            )
+            .order_by('-created_at', '-id')
         )
         category_id = self.request.GET.get('category')
         if category_id:
             qs = qs.filter(category_id=category_id)
         return qs
 
+    def paginate_queryset(self, queryset, page_size):
+        # Cursor-based pages (?after= / ?before=) instead of OFFSET page numbers
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx['categories'] = Category.objects.order_by('name')
+        # Cached list shared with ProductForm's category choices
+        ctx['categories'] = get_cached_categories()
         ctx['selected_category'] = self.request.GET.get('category', '')
         return ctx
 
 
+def _review_eligibility(user):
+    """Product annotations for whether user has reviewed / received the product"""
+    return {
+        '_has_reviewed': Exists(Review.objects.filter(product=OuterRef('pk'), buyer=user)),
+        '_purchased_delivered': Exists(OrderItem.objects.filter(
+            product=OuterRef('pk'),
+            order__buyer=user,
+            order__status='delivered',
+        )),
+    }
+
+
 class PublicProductDetailView(DetailView):
+    # Latest reviews listed on the page; avg_rating and review_count cover all
+    REVIEWS_SHOWN = 20
+
     model = Product
     template_name = 'users/product_detail.html'
     context_object_name = 'product'
 
+    def _is_buyer(self):
+        return self.request.user.is_authenticated and getattr(self.request.user, 'user_type', None) == 'buyer'
+
     def get_queryset(self):
-        return Product.objects.select_related('category', 'farmer', 'farmer__user').prefetch_related('reviews')
+        qs = (
+            Product.objects.select_related('category', 'farmer', 'farmer__user')
+            .annotate(avg_rating=Avg('reviews__rating'), review_count=Count('reviews', distinct=True))
+            .prefetch_related(Prefetch(
+                'reviews',
+                queryset=Review.objects.select_related('buyer').filter(
+                    id__in=Subquery(
+                        Review.objects.filter(product=OuterRef('product'))
+                        .order_by('-created_at')
+                        .values('id')[:self.REVIEWS_SHOWN]
+                    )
+                ).order_by('-created_at'),
+            ))
+        )
+        if self._is_buyer():
+            # Review eligibility checks embedded in the product SELECT
+            qs = qs.annotate(**_review_eligibility(self.request.user))
+        return qs
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         product = ctx['product']
-        ctx['avg_rating'] = product.reviews.aggregate(avg=Avg('rating'))['avg']
-        ctx['review_count'] = product.reviews.count()
+        ctx['avg_rating'] = product.cached_avg_rating
+        ctx['review_count'] = product.cached_review_count
 
         can_review = False
         has_reviewed = False
-        if self.request.user.is_authenticated and getattr(self.request.user, 'user_type', None) == 'buyer':
-            has_reviewed = Review.objects.filter(product=product, buyer=self.request.user).exists()
-            purchased_delivered = OrderItem.objects.filter(
-                order__buyer=self.request.user,
-                order__status='delivered',
-                product=product,
-            ).exists()
-            can_review = purchased_delivered and not has_reviewed
+        if self._is_buyer():
+            has_reviewed = product._has_reviewed
+            can_review = product._purchased_delivered and not has_reviewed
 
         ctx['can_review'] = can_review
         ctx['has_reviewed'] = has_reviewed
@@ -206,36 +264,42 @@ def _save_cart(session, cart):
     session.modified = True
 
 
+def _parse_cart(session):
+    """Return ({product_id: quantity}, cart) with the session's string keys parsed once."""
+    cart = _get_cart(session)
+    qty_by_pid = {int(pid): int(entry.get('quantity', 0)) for pid, entry in cart.items()}
+    return qty_by_pid, cart
+
+
+def _cart_product_rows(product_ids):
+    # Plain dicts with only the columns the cart pages render and total up
+    return Product.objects.filter(id__in=product_ids).values(
+        'id', 'name', 'price', 'quantity_available', farm_name=F('farmer__farm_name')
+    )
+
+
 class CartDetailView(BuyerRequiredMixin, TemplateView):
     template_name = 'users/cart_detail.html'
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        cart = _get_cart(self.request.session)
-        product_ids = [int(pid) for pid in cart.keys()]
-
-        products = (
-            Product.objects.filter(id__in=product_ids)
-            .select_related('category', 'farmer', 'farmer__user')
-        )
-        products_by_id = {p.id: p for p in products}
+        qty_by_pid, _ = _parse_cart(self.request.session)
+        products_by_id = {p['id']: p for p in _cart_product_rows(qty_by_pid)}
 
         items = []
         total = Decimal('0.00')
-        for pid_str, entry in cart.items():
-            pid = int(pid_str)
+        for pid, qty in qty_by_pid.items():
             product = products_by_id.get(pid)
             if not product:
                 continue
-            qty = int(entry.get('quantity', 0))
             qty = max(qty, 0)
-            line_total = (product.price * qty) if qty else Decimal('0.00')
+            line_total = (product['price'] * qty) if qty else Decimal('0.00')
             total += line_total
             items.append({
                 'product': product,
                 'quantity': qty,
                 'line_total': line_total,
-                'max_qty': max(product.quantity_available, 0),
+                'max_qty': max(product['quantity_available'], 0),
             })
 
         ctx['items'] = items
@@ -245,10 +309,13 @@ class CartDetailView(BuyerRequiredMixin, TemplateView):
 
 class CartAddView(BuyerRequiredMixin, View):
     def post(self, request, product_id):
-        product = get_object_or_404(Product, pk=product_id)
-        if product.quantity_available <= 0:
+        # Only the stock level is needed to cap the quantity
+        stock = Product.objects.filter(pk=product_id).values_list('quantity_available', flat=True).first()
+        if stock is None:
+            raise Http404("Product not found.")
+        if stock <= 0:
             messages.error(request, "This product is out of stock.")
-            return redirect('product-detail', pk=product.id)
+            return redirect('product-detail', pk=product_id)
 
         try:
             qty = int(request.POST.get('quantity', 1))
@@ -257,13 +324,13 @@ class CartAddView(BuyerRequiredMixin, View):
         qty = max(qty, 1)
 
         cart = _get_cart(request.session)
-        current_qty = int(cart.get(str(product.id), {}).get('quantity', 0))
+        current_qty = int(cart.get(str(product_id), {}).get('quantity', 0))
         new_qty = current_qty + qty
 
-        if new_qty > product.quantity_available:
-            new_qty = product.quantity_available
+        if new_qty > stock:
+            new_qty = stock
             messages.warning(request, "Quantity adjusted to available stock.")
-        cart[str(product.id)] = {'quantity': new_qty}
+        cart[str(product_id)] = {'quantity': new_qty}
         _save_cart(request.session, cart)
         messages.success(request, "Added to cart.")
         return redirect('cart')
@@ -280,7 +347,7 @@ class CartRemoveView(BuyerRequiredMixin, View):
 
 class CartUpdateView(BuyerRequiredMixin, View):
     def post(self, request):
-        cart = _get_cart(request.session)
+        qty_by_pid, cart = _parse_cart(request.session)
         remove_pid = request.POST.get('remove')
         if remove_pid:
             cart.pop(str(remove_pid), None)
@@ -288,25 +355,24 @@ class CartUpdateView(BuyerRequiredMixin, View):
             messages.success(request, "Removed from cart.")
             return redirect('cart')
 
-        product_ids = [int(pid) for pid in cart.keys()]
-        products = Product.objects.filter(id__in=product_ids)
-        products_by_id = {p.id: p for p in products}
+        stock_by_id = dict(
+            Product.objects.filter(id__in=qty_by_pid).values_list('id', 'quantity_available')
+        )
 
         updated = {}
-        for pid_str in cart.keys():
-            product = products_by_id.get(int(pid_str))
-            if not product:
+        for pid, current_qty in qty_by_pid.items():
+            if pid not in stock_by_id:
                 continue
-            raw = request.POST.get(f'qty_{pid_str}', None)
+            raw = request.POST.get(f'qty_{pid}', None)
             try:
                 qty = int(raw)
             except (TypeError, ValueError):
-                qty = int(cart.get(pid_str, {}).get('quantity', 0))
+                qty = current_qty
 
             if qty <= 0:
                 continue
-            qty = min(qty, max(product.quantity_available, 0))
-            updated[pid_str] = {'quantity': qty}
+            qty = min(qty, max(stock_by_id[pid], 0))
+            updated[str(pid)] = {'quantity': qty}
 
         _save_cart(request.session, updated)
         messages.success(request, "Cart updated.")
@@ -322,28 +388,22 @@ class CheckoutView(BuyerRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        cart = _get_cart(self.request.session)
-        if not cart:
+        qty_by_pid, _ = _parse_cart(self.request.session)
+        if not qty_by_pid:
             ctx['items'] = []
             ctx['total'] = Decimal('0.00')
             return ctx
 
-        product_ids = [int(pid) for pid in cart.keys()]
-        products = (
-            Product.objects.filter(id__in=product_ids)
-            .select_related('farmer', 'farmer__user', 'category')
-        )
-        products_by_id = {p.id: p for p in products}
+        products_by_id = {p['id']: p for p in _cart_product_rows(qty_by_pid)}
 
         items = []
         total = Decimal('0.00')
-        for pid_str, entry in cart.items():
-            product = products_by_id.get(int(pid_str))
+        for pid, qty in qty_by_pid.items():
+            product = products_by_id.get(pid)
             if not product:
                 continue
-            qty = int(entry.get('quantity', 0))
             qty = max(qty, 0)
-            line_total = product.price * qty if qty else Decimal('0.00')
+            line_total = product['price'] * qty if qty else Decimal('0.00')
             total += line_total
             items.append({'product': product, 'quantity': qty, 'line_total': line_total})
 
@@ -353,25 +413,21 @@ class CheckoutView(BuyerRequiredMixin, TemplateView):
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
-        cart = _get_cart(request.session)
-        if not cart:
+        qty_by_pid, _ = _parse_cart(request.session)
+        if not qty_by_pid:
             messages.error(request, "Your cart is empty.")
             return redirect('cart')
 
-        product_ids = [int(pid) for pid in cart.keys()]
-        products = (
-            Product.objects.select_for_update()
-            .filter(id__in=product_ids)
-            .select_related('farmer')
-        )
+        # Only farmer_id is needed for grouping; joining FarmerProfile here
+        # would also lock its rows
+        products = Product.objects.select_for_update().filter(id__in=qty_by_pid)
         products_by_id = {p.id: p for p in products}
 
         # Validate stock under lock
-        for pid_str, entry in cart.items():
-            product = products_by_id.get(int(pid_str))
+        for pid, qty in qty_by_pid.items():
+            product = products_by_id.get(pid)
             if not product:
                 raise Http404("Product not found.")
-            qty = int(entry.get('quantity', 0))
             if qty <= 0:
                 messages.error(request, "Invalid cart quantity.")
                 return redirect('cart')
@@ -381,27 +437,40 @@ class CheckoutView(BuyerRequiredMixin, TemplateView):
 
         # Group items by farmer to create one Order per farmer (multi-vendor)
         grouped = {}
-        for pid_str, entry in cart.items():
-            product = products_by_id[int(pid_str)]
-            qty = int(entry.get('quantity', 0))
+        for pid, qty in qty_by_pid.items():
+            product = products_by_id[pid]
             grouped.setdefault(product.farmer_id, []).append((product, qty))
 
+        # Stock was validated above under lock, so items are bulk-inserted
+        # (skipping OrderItem.clean) and stock is decremented in one UPDATE
         created_orders = []
         for farmer_id, entries in grouped.items():
-            order = Order.objects.create(buyer=request.user, status='pending')
-            for product, qty in entries:
-                OrderItem.objects.create(
+            order_total = sum((product.price * qty for product, qty in entries), Decimal('0.00'))
+            order = Order.objects.create(buyer=request.user, status='pending', total=order_total)
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
                     product=product,
                     quantity=qty,
                     price_at_time=product.price,
                 )
-                product.quantity_available -= qty
-                product.save(update_fields=['quantity_available'])
+                for product, qty in entries
+            ])
 
-            Payment.objects.create(order=order, status='pending', amount=order.total_amount)
+            Payment.objects.create(order=order, status='pending', amount=order_total)
             created_orders.append(order.id)
 
+        Product.objects.filter(id__in=qty_by_pid).update(
+            quantity_available=F('quantity_available') - Case(
+                *[When(id=pid, then=Value(qty)) for pid, qty in qty_by_pid.items()],
+                output_field=IntegerField(),
+            )
+        )
+
+        # Items were bulk-created without signals; the buyer's order count is
+        # cleared by the Order post_save handler
+        invalidate_farmer_order_count(*grouped)
+
         # Clear cart + remember order ids for a success message
         request.session[SESSION_CART_KEY] = {}
         request.session['last_order_ids'] = created_orders
@@ -420,12 +489,21 @@ class BuyerOrderListView(BuyerRequiredMixin, ListView):
     template_name = 'users/buyer_orders.html'
     context_object_name = 'orders'
     paginate_by = 20
+    paginator_class = CachedCountPaginator
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return super().get_paginator(
+            queryset,
+            per_page,
+            cache_key=buyer_order_count_key(self.request.user.id),
+            cache_timeout=ORDER_COUNT_TIMEOUT,
+            **kwargs
+        )
 
     def get_queryset(self):
         return (
             Order.objects.filter(buyer=self.request.user)
             .select_related('buyer')
-            .prefetch_related('items__product')
             .order_by('-created_at')
         )
 
@@ -438,25 +516,31 @@ class BuyerOrderDetailView(BuyerRequiredMixin, DetailView):
     def get_queryset(self):
         return (
             Order.objects.filter(buyer=self.request.user)
-            .select_related('buyer')
+            .select_related('buyer', 'payment')
             .prefetch_related('items__product', 'items__product__farmer', 'items__product__farmer__user')
         )
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx['payment'] = Payment.objects.filter(order=self.object).first()
+        ctx['payment'] = getattr(self.object, 'payment', None)
         return ctx
 
 
 class BuyerPayOrderView(BuyerRequiredMixin, View):
     @transaction.atomic
     def post(self, request, pk):
-        order = get_object_or_404(Order, pk=pk, buyer=request.user)
+        # Lock the order row so a double-submitted payment is applied once
+        order = get_object_or_404(
+            Order.objects.select_for_update(of=('self',)).select_related('payment'),
+            pk=pk,
+            buyer=request.user,
+        )
         payment = getattr(order, 'payment', None)
         if not payment:
             raise Http404("Payment not found.")
-        payment.status = 'completed'
-        payment.save()
+        if payment.status != 'completed':
+            payment.status = 'completed'
+            payment.save(update_fields=['status'])
         if order.status in {'pending', 'confirmed'}:
             order.status = 'paid'
             order.save(update_fields=['status'])
@@ -464,18 +548,33 @@ class BuyerPayOrderView(BuyerRequiredMixin, View):
         return redirect('buyer-order-detail', pk=order.id)
 
 
+def _farmer_orders(farmer_profile):
+    # EXISTS keeps the outer query on Order alone: no join fan-out, no DISTINCT
+    has_farmer_items = OrderItem.objects.filter(order=OuterRef('pk'), product__farmer=farmer_profile)
+    return Order.objects.filter(Exists(has_farmer_items))
+
+
 class FarmerOrderListView(FarmerRequiredMixin, ListView):
     model = Order
     template_name = 'users/farmer_orders.html'
     context_object_name = 'orders'
     paginate_by = 20
+    paginator_class = CachedCountPaginator
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return super().get_paginator(
+            queryset,
+            per_page,
+            cache_key=farmer_order_count_key(self.farmer_profile.id),
+            cache_timeout=ORDER_COUNT_TIMEOUT,
+            **kwargs
+        )
 
     def get_queryset(self):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
+        farmer_profile = self.farmer_profile
         item_qs = OrderItem.objects.select_related('product').filter(product__farmer=farmer_profile)
         return (
-            Order.objects.filter(items__product__farmer=farmer_profile)
-            .distinct()
+            _farmer_orders(farmer_profile)
             .prefetch_related(Prefetch('items', queryset=item_qs))
             .order_by('-created_at')
         )
@@ -487,16 +586,16 @@ class FarmerOrderDetailView(FarmerRequiredMixin, DetailView):
     context_object_name = 'order'
 
     def get_object(self, queryset=None):
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
+        farmer_profile = self.farmer_profile
         order = get_object_or_404(
-            Order.objects.filter(items__product__farmer=farmer_profile).distinct(),
+            _farmer_orders(farmer_profile),
             pk=self.kwargs['pk'],
         )
         return order
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        farmer_profile = FarmerProfile.objects.get(user=self.request.user)
+        farmer_profile = self.farmer_profile
         ctx['order_items'] = (
             self.object.items.select_related('product')
             .filter(product__farmer=farmer_profile)
@@ -509,17 +608,18 @@ class FarmerOrderStatusUpdateView(FarmerRequiredMixin, View):
 
     @transaction.atomic
     def post(self, request, pk):
-        farmer_profile = FarmerProfile.objects.get(user=request.user)
+        farmer_profile = self.farmer_profile
         order = get_object_or_404(
-            Order.objects.filter(items__product__farmer=farmer_profile).distinct(),
+            _farmer_orders(farmer_profile),
             pk=pk,
         )
         new_status = request.POST.get('status')
         if new_status not in self.allowed_statuses:
             messages.error(request, "Invalid status.")
             return redirect('farmer-order-detail', pk=order.id)
-        order.status = new_status
-        order.save(update_fields=['status'])
+        if order.status != new_status:
+            order.status = new_status
+            order.save(update_fields=['status'])
         messages.success(request, "Order status updated.")
         return redirect('farmer-order-detail', pk=order.id)
 
@@ -534,17 +634,19 @@ class ReviewCreateView(BuyerRequiredMixin, CreateView):
     template_name = 'users/review_form.html'
 
     def dispatch(self, request, *args, **kwargs):
-        self.product = get_object_or_404(Product, pk=kwargs['pk'])
+        if not request.user.is_authenticated:
+            # Let LoginRequiredMixin redirect to the login page
+            return super().dispatch(request, *args, **kwargs)
+        # The product and both eligibility checks in one query
+        self.product = get_object_or_404(
+            Product.objects.annotate(**_review_eligibility(request.user)),
+            pk=kwargs['pk'],
+        )
         # Must have a delivered purchase of this product
-        purchased_delivered = OrderItem.objects.filter(
-            order__buyer=request.user,
-            order__status='delivered',
-            product=self.product,
-        ).exists()
-        if not purchased_delivered:
+        if not self.product._purchased_delivered:
             raise Http404("You can only review products from delivered orders.")
         # Prevent duplicates
-        if Review.objects.filter(product=self.product, buyer=request.user).exists():
+        if self.product._has_reviewed:
             messages.info(request, "You have already reviewed this product.")
             return redirect('product-detail', pk=self.product.id)
         return super().dispatch(request, *args, **kwargs)
@@ -4,20 +4,42 @@ Handles triggering n8n workflows when messages are created.
 """
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Message
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
 
 
 logger = logging.getLogger(__name__)
 
+_HEADERS = {
+    'Content-Type': 'application/json',
+    'X-Source': 'localfarmconnect'
+}
+
+# Shared worker pool for webhook calls; the semaphore bounds how many can be
+# queued or running so a burst of messages can't pile up unbounded work
+_EXECUTOR = ThreadPoolExecutor(max_workers=settings.N8N_WORKERS, thread_name_prefix='n8n')
+_PENDING = threading.BoundedSemaphore(settings.N8N_MAX_PENDING)
+
 
 def create_retry_session(
     retries=3,
     backoff_factor=0.5,
     status_forcelist=(500, 502, 503, 504),
+    pool_maxsize=10,
 ):
     """Create a requests session with retry logic"""
     session = requests.Session()
@@ -28,29 +50,45 @@ def create_retry_session(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
 
-def trigger_n8n_webhook(message):
+def _encode_payload(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+# Shared by the worker threads so keep-alive connections to n8n are reused;
+# one pooled connection per worker
+_SESSION = create_retry_session(retries=2, pool_maxsize=settings.N8N_WORKERS)
+
+
+def trigger_n8n_webhook(message_id):
     """
     Trigger n8n webhook when a new message is created.
     
-    This function is called from the Message model's save method.
-    It runs asynchronously (via thread) to not block the user experience.
+    Runs on the webhook worker pool. The message is loaded here, with its
+    conversation, participants and product in one query, rather than
+    sharing the request thread's model instance.
     """
-    # Only trigger for buyer messages (not automated responses)
-    if message.is_automated:
-        return
-    
     # Only trigger if n8n is enabled
     if not settings.N8N_ENABLED:
         return
-    
-    # Only trigger for buyer -> farmer messages
-    if message.sender != message.conversation.buyer:
+
+    try:
+        message = Message.objects.select_related(
+            'sender', 'conversation__buyer', 'conversation__farmer', 'conversation__product'
+        ).get(pk=message_id)
+    except Message.DoesNotExist:
+        logger.warning(f"Message {message_id} no longer exists, skipping n8n webhook")
+        return
+
+    # Only trigger for buyer -> farmer messages (not automated responses)
+    if message.is_automated or message.sender_id != message.conversation.buyer_id:
         return
     
     try:
@@ -69,16 +107,11 @@ def trigger_n8n_webhook(message):
             'timestamp': message.timestamp.isoformat()
         }
         
-        session = create_retry_session(retries=2)
-        
-        response = session.post(
+        response = _SESSION.post(
             settings.N8N_WEBHOOK_URL,
-            json=payload,
+            data=_encode_payload(payload),
             timeout=settings.N8N_WEBHOOK_TIMEOUT,
-            headers={
-                'Content-Type': 'application/json',
-                'X-Source': 'localfarmconnect'
-            }
+            headers=_HEADERS
         )
         
         if response.status_code == 200:
@@ -105,17 +138,38 @@ def trigger_n8n_webhook(message):
         )
 
 
+def _run_webhook(message_id):
+    close_old_connections()
+    try:
+        trigger_n8n_webhook(message_id)
+    finally:
+        # Pool threads are long-lived; don't let them hold stale DB connections
+        close_old_connections()
+        _PENDING.release()
+
+
 def trigger_n8n_webhook_async(message):
     """
-    Trigger n8n webhook in a background thread.
+    Trigger n8n webhook on the shared worker pool.
     This ensures the user experience is not blocked.
     """
-    import threading
-    
-    thread = threading.Thread(
-        target=trigger_n8n_webhook,
-        args=(message,),
-        daemon=True
-    )
-    thread.start()
-    logger.debug(f"Started n8n webhook thread for message {message.id}")
+    if not settings.N8N_ENABLED:
+        return
+
+    # Checked again by the worker; this just avoids queueing no-op jobs
+    if message.is_automated or message.sender_id != message.conversation.buyer_id:
+        return
+
+    # The worker reloads the message by id, so wait until it is committed
+    transaction.on_commit(lambda: _submit_webhook(message.id))
+
+
+def _submit_webhook(message_id):
+    if not _PENDING.acquire(blocking=False):
+        logger.warning(
+            f"n8n webhook backlog full, dropping webhook for message {message_id}"
+        )
+        return
+
+    _EXECUTOR.submit(_run_webhook, message_id)
+    logger.debug(f"Queued n8n webhook for message {message_id}")